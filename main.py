@@ -1,75 +1,175 @@
+import argparse
+from datetime import datetime, timedelta
 from pathlib import Path
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
-import folium
-from folium.plugins import MarkerCluster
-from folium.plugins import HeatMap
 import re
-from collections import Counter
 
 
 
 BASE_URL = "https://data.littlerock.gov/resource/2x6n-j9fb.json"
 CACHE_FILE = Path("data.json")
+CACHE_META = Path("data.etag")
+CACHE_TTL = timedelta(hours=1)
+
+# The only fields the map and dashboard use
+COLUMNS = [
+    "latitude",
+    "longitude",
+    "ticket_status",
+    "issue_sub_category",
+    "ticket_created_date_time",
+    "street_address",
+]
+
+# Open pothole tickets that can be placed on the map
+WHERE = "issue_sub_category like '%Pothole%' AND ticket_status = 'Open' AND latitude IS NOT NULL"
+LIMIT = 5000
+
+# Reuse one connection pool for every call to the portal
+SESSION = requests.Session()
+SESSION.headers.update({"Accept-Encoding": "gzip, deflate"})
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+REQUEST_TIMEOUT = (5, 30)
+
+# Address patterns used by the dashboard
+LEADING_NUMBER = re.compile(r'^\d+\s+')
+INTERSECTION = re.compile(r'&|/| AND ')
+
+def cache_is_fresh():
+    """True if the cached response is recent enough to skip the network."""
+    if not CACHE_FILE.exists():
+        return False
+    expires = datetime.fromtimestamp(CACHE_FILE.stat().st_mtime) + CACHE_TTL
+    return datetime.now() < expires
+
+def cache_headers():
+    """Conditional GET headers from the last successful fetch."""
+    if not (CACHE_FILE.exists() and CACHE_META.exists()):
+        return {}
+    meta = orjson.loads(CACHE_META.read_bytes())
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+def report_missing_category():
+    """Lists the available categories when the pothole filter matches nothing, then exits."""
+    print("No 'Pothole' records found. The category names might have changed.")
+    print("Fetching available categories to help you find the right one...")
+    cat_params = {"$select": "issue_sub_category", "$group": "issue_sub_category", "$limit": 20}
+    cat_response = SESSION.get(BASE_URL, params=cat_params, timeout=REQUEST_TIMEOUT)
+    print(pd.DataFrame(orjson.loads(cat_response.content)))
+    exit()
 
 def fetch_data():
-    """Fetches fresh data from the API."""
+    """Fetches data from the API, reusing the on-disk cache when it is still valid."""
+    if cache_is_fresh():
+        print(f"Using cached data from {CACHE_FILE}")
+        return orjson.loads(CACHE_FILE.read_bytes())
+
     params = {
-        "$limit": 5000,
-        "$where": "issue_sub_category like '%Pothole%' AND ticket_status = 'Open' AND latitude IS NOT NULL",
+        "$select": ",".join(COLUMNS),
+        "$limit": LIMIT,
+        "$where": WHERE,
         "$order": "ticket_created_date_time DESC"
     }
     
     print("Fetching data from Little Rock Open Data Portal...")
-    response = requests.get(BASE_URL, params=params)
+    response = SESSION.get(BASE_URL, params=params, headers=cache_headers(), timeout=REQUEST_TIMEOUT)
+
+    if response.status_code == 304:
+        print(f"Data unchanged, using cached data from {CACHE_FILE}")
+        CACHE_FILE.touch()
+        return orjson.loads(CACHE_FILE.read_bytes())
     
     if response.status_code != 200:
         print(f"Error fetching data: {response.status_code}")
         return []
     
-    data = response.json()
+    data = orjson.loads(response.content)
+
+    if not data:
+        report_missing_category()
+
+    CACHE_FILE.write_bytes(response.content)
+    CACHE_META.write_bytes(orjson.dumps({
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }))
+
+    return data
+
+def fetch_address_counts():
+    """Fetches the number of open potholes per street address, grouped server-side."""
+    params = {
+        "$select": "street_address, count(*) AS c",
+        "$where": WHERE,
+        "$group": "street_address",
+        "$order": "c DESC",
+        "$limit": LIMIT
+    }
+
+    print("Fetching pothole counts per address...")
+    response = SESSION.get(BASE_URL, params=params, timeout=REQUEST_TIMEOUT)
+
+    if response.status_code != 200:
+        print(f"Error fetching address counts: {response.status_code}")
+        return []
+
+    data = orjson.loads(response.content)
 
     if not data:
-        print("No 'Pothole' records found. The category names might have changed.")
-        print("Fetching available categories to help you find the right one...")
-        cat_params = {"$select": "issue_sub_category", "$group": "issue_sub_category", "$limit": 20}
-        cat_response = requests.get(BASE_URL, params=cat_params)
-        print(pd.DataFrame(cat_response.json()))
-        exit()
+        report_missing_category()
 
     return data
 
-def generate_dashboard_html(df):
-    """Generates a text-based HTML dashboard of top streets and intersections."""
+def count_addresses(df):
+    """Counts potholes per street address from already-fetched ticket rows."""
+    return df.groupby('street_address', dropna=False).size().reset_index(name='c')
+
+def generate_dashboard_html(counts, output_path=Path("stats.html")):
+    """Generates a text-based HTML dashboard of top streets and intersections from per-address counts."""
     
     # --- 0. Calculate Totals ---
-    total_potholes = len(df)
+    total_potholes = int(counts['c'].sum())
     
     # --- 1. Top Streets Logic ---
-    street_names = []
-    intersections = []
-    
-    for address in df['street_address'].dropna():
-        address = str(address).upper().strip()
-        
-        # Check if it's an intersection
-        if '&' in address or ' AND ' in address or '/' in address:
-            intersections.append(address)
-        else:
-            # Clean street names
-            clean_street = re.sub(r'^\d+\s+', '', address)
-            clean_street = clean_street.replace("BLOCK OF ", "")
-            street_names.append(clean_street)
+    # Classification stays in pandas' vectorized .str methods; string/regex
+    # work gets no benefit from numba, so don't wrap this in a JIT.
+    counts = counts.dropna(subset=['street_address'])
+    addresses = counts['street_address'].astype(str).str.upper().str.strip()
+
+    # Check if it's an intersection
+    is_intersection = addresses.str.contains(INTERSECTION, na=False)
+    intersections = addresses[is_intersection].astype('category')
+
+    # Clean street names
+    street_names = (
+        addresses[~is_intersection]
+        .str.replace(LEADING_NUMBER, '', regex=True)
+        .str.removeprefix("BLOCK OF ")
+        .astype('category')
+    )
 
     # Get Top 10 Streets
-    top_streets = Counter(street_names).most_common(10)
+    # Several addresses collapse onto one street, so add their counts up
+    street_totals = counts['c'][~is_intersection].groupby(street_names, observed=True).sum()
+    top_streets = list(street_totals.nlargest(10).items())
     
     # Get Intersections (Filter: Must have > 1 pothole)
-    raw_intersections = Counter(intersections).most_common(10)
-    valid_intersections = [(name, count) for name, count in raw_intersections if count > 1]
+    intersection_totals = counts['c'][is_intersection].groupby(intersections, observed=True).sum()
+    valid_intersections = list(
+        intersection_totals.nlargest(10).loc[lambda totals: totals > 1].items()
+    )
     
     # --- 2. Build the HTML ---
-    html_content = f"""
+    parts = []
+    parts.append(f"""
     <!DOCTYPE html>
     <html>
     <head>
@@ -117,99 +217,149 @@ def generate_dashboard_html(df):
 
         <h2>Streets with Most Potholes</h2>
         <ul>
-            {''.join([f'<li><span>{name.title()}</span> <span class="count">{count}</span></li>' for name, count in top_streets])}
+            {''.join(f'<li><span>{name.title()}</span> <span class="count">{count}</span></li>' for name, count in top_streets)}
         </ul>
-    """
+    """)
     
     # CONDITIONAL SECTION: Only add Intersections if we have valid ones
     if valid_intersections:
-        html_content += f"""
+        parts.append(f"""
         <h2>Top Intersections</h2>
         <ul>
-            {''.join([f'<li><span>{name.title()}</span> <span class="count">{count}</span></li>' for name, count in valid_intersections])}
+            {''.join(f'<li><span>{name.title()}</span> <span class="count">{count}</span></li>' for name, count in valid_intersections)}
         </ul>
-        """
+        """)
         
-    html_content += f"""
+    parts.append(f"""
         <div class="footer">
             Data updated: {pd.Timestamp.now().strftime('%Y-%m-%d')}
         </div>
     </body>
     </html>
-    """
+    """)
+    html_content = ''.join(parts)
     
     # --- 3. Save the file ---
-    output_path = Path("stats.html")
-    with output_path.open("w", encoding="utf-8") as f:
-        f.write(html_content)
+    output_path.write_bytes(html_content.encode("utf-8"))
     print(f"Dashboard saved to {output_path}")
 
 
-# --- MAIN LOGIC ---
+# Popup fields and the text shown when a ticket is missing one
+MARKER_DEFAULTS = {
+    'ticket_status': 'Unknown',
+    'issue_sub_category': 'N/A',
+    'ticket_created_date_time': 'N/A',
+    'street_address': 'N/A',
+}
+MARKER_COLUMNS = ['lat', 'lon', *MARKER_DEFAULTS]
 
-data = fetch_data()
+# Builds each marker client-side from a [lat, lon, popup, color] row
+MARKER_CALLBACK = """
+function (row) {
+    var icon = L.AwesomeMarkers.icon({icon: 'info-sign', markerColor: row[3]});
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+    marker.bindPopup(row[2], {maxWidth: 300});
+    return marker;
+}
+"""
 
-if not data:
-    print("No data available.")
-    exit()
+def prepare_points(df):
+    """Returns the rows with usable coordinates, ready for the map layers."""
+    # Convert lat/lon to float in one pass, dropping rows that don't parse
+    points = df.assign(
+        lat=pd.to_numeric(df['latitude'], errors='coerce'),
+        lon=pd.to_numeric(df['longitude'], errors='coerce')
+    ).dropna(subset=['lat', 'lon'])
 
-df = pd.DataFrame(data)
+    # Make sure every popup column exists and fill blanks once per column
+    return (
+        points.reindex(columns=MARKER_COLUMNS)
+        .fillna(MARKER_DEFAULTS)
+        .astype(dict.fromkeys(MARKER_DEFAULTS, str))
+    )
 
-# Center map on Little Rock
-lr_map = folium.Map(location=[34.7465, -92.2896], zoom_start=12)
+def add_markers(lr_map, points):
+    from folium.plugins import FastMarkerCluster
 
-def add_markers():
-    marker_cluster = MarkerCluster().add_to(lr_map)
+    # Color code: Open = Red, Closed = Green
+    colors = points['ticket_status'].eq('Open').map({True: 'red', False: 'green'})
 
-    for idx, row in df.iterrows():
-        # Convert lat/lon to float
-        try:
-            lat = float(row['latitude'])
-            lon = float(row['longitude'])
-        except (ValueError, TypeError):
-            continue
+    popups = (
+        '<b>Type:</b> ' + points['issue_sub_category']
+        + '<br><b>Status:</b> ' + points['ticket_status']
+        + '<br><b>Date:</b> ' + points['ticket_created_date_time']
+        + '<br><b>Address:</b> ' + points['street_address']
+    )
 
-        # Color code: Open = Red, Closed = Green
-        status = row.get('ticket_status', 'Unknown')
-        color = 'red' if status == 'Open' else 'green'
-        
-        popup_text = f"""
-        <b>Type:</b> {row.get('issue_sub_category', 'N/A')}<br>
-        <b>Status:</b> {status}<br>
-        <b>Date:</b> {row.get('ticket_created_date_time', 'N/A')}<br>
-        <b>Address:</b> {row.get('street_address', 'N/A')}
-        """
-        
-        folium.Marker(
-            location=[lat, lon],
-            popup=folium.Popup(popup_text, max_width=300),
-            icon=folium.Icon(color=color, icon='info-sign')
-        ).add_to(marker_cluster)
-  
+    marker_data = [
+        [lat, lon, popup, color]
+        for (lat, lon), popup, color in zip(
+            points[['lat', 'lon']].to_numpy().tolist(), popups.tolist(), colors.tolist()
+        )
+    ]
 
-def add_heat_clouds():
-    heat_data = []
+    FastMarkerCluster(data=marker_data, callback=MARKER_CALLBACK).add_to(lr_map)
+  
 
-    for idx, row in df.iterrows():
-        try:
-            lat = float(row['latitude'])
-            lon = float(row['longitude'])
-            heat_data.append([lat, lon])
-        except (ValueError, TypeError):
-            continue
+def add_heat_clouds(lr_map, points):
+    from folium.plugins import HeatMap
 
     # Add HeatMap layer
     HeatMap(
-        heat_data, 
+        points[['lat', 'lon']].to_numpy(), 
         radius=25, 
         blur=25, 
         min_opacity=0.4
     ).add_to(lr_map)
 
-add_markers()
 
-output_file = "map.html"
-lr_map.save(output_file)
-print(f"Map saved to {output_file}")
+def build_map(df):
+    """Builds the folium map of open pothole reports."""
+    # Imported here so stats-only runs don't pay for loading folium
+    import folium
+
+    # Center map on Little Rock
+    lr_map = folium.Map(location=[34.7465, -92.2896], zoom_start=12)
+    points = prepare_points(df)
+    add_markers(lr_map, points)
+    return lr_map
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Map open pothole reports in Little Rock.")
+    parser.add_argument("--map-out", default="map.html", help="where to write the map (default: map.html)")
+    parser.add_argument("--stats-out", default="stats.html", help="where to write the dashboard (default: stats.html)")
+    parser.add_argument("--skip-map", action="store_true", help="only build the stats dashboard")
+    args = parser.parse_args()
+
+    if not args.skip_map:
+        data = fetch_data()
+
+        if not data:
+            print("No data available.")
+            exit()
+
+        df = pd.DataFrame.from_records(data, columns=COLUMNS)
+
+        lr_map = build_map(df)
+        map_path = Path(args.map_out)
+        map_path.write_bytes(lr_map.get_root().render().encode("utf-8"))
+        print(f"Map saved to {args.map_out}")
+
+        # Reuse the rows behind the map so both pages show the same data
+        counts = count_addresses(df)
+    else:
+        address_data = fetch_address_counts()
+
+        if not address_data:
+            print("No data available.")
+            exit()
+
+        counts = pd.DataFrame.from_records(address_data, columns=["street_address", "c"])
+        counts["c"] = pd.to_numeric(counts["c"])
+
+    generate_dashboard_html(counts, Path(args.stats_out))
+
 
-generate_dashboard_html(df)
\ No newline at end of file
+if __name__ == "__main__":
+    main()